@@ -3,16 +3,59 @@ Info and utils about windows devices
 """
 import typing
 import time
+import json
+import asyncio
 import subprocess
-from winDevices.powershellColonObjects import (
-    PowershellColonObject,PowershellColonObjects)
+from powershellColonObjects import (
+    PowershellColonObject,PowershellColonObjects,executePs)
+
+# base command line for every powershell call
+# (skipping the profile/logo/policy checks saves
+# a few hundred ms per invocation)
+PS_BASE=['powershell',
+    '-NoLogo','-NoProfile','-ExecutionPolicy','Bypass','-Command']
+
+# keep child powershell processes from flashing up a console window
+# (the flag only exists on windows)
+_NO_WINDOW=getattr(subprocess,'CREATE_NO_WINDOW',0)
+
+# when True, device queries ask powershell for json
+# (parsed in C by json.loads, and immune to the multi-line
+# value quirks of the colon-delimited text format)
+usePsJson:bool=True
+
+# short-lived cache of device enumerations keyed by device class
+# (hardware changes rarely, but each enumeration
+# is a slow powershell query)
+deviceCacheTtlSec:float=5.0
+_deviceCache:typing.Dict[
+    str,typing.Tuple[float,typing.List["WinDevice"]]]={}
+
+def clearDeviceCache()->None:
+    """
+    Throw away any cached device enumerations
+    (done automatically whenever a device is enabled/disabled)
+    """
+    _deviceCache.clear()
+
+def _runPs(psCmd:str)->str:
+    """
+    Run a powershell command and return its output
+
+    Delegates to the shared session in powershellColonObjects so the
+    whole program keeps exactly one long-lived powershell process
+    (set powershellColonObjects.usePersistentSession=False there to
+    fall back to a process per call).
+    """
+    return executePs(psCmd).strip()
 
 class WinDevice(PowershellColonObject):
     """
     Info and utils for a single windows device
     """
     def __init__(self,
-        rawFromPowershell:typing.Optional[str]=None):
+        rawFromPowershell:typing.Union[
+            None,str,typing.Dict[str,typing.Any]]=None):
         """ """
         self.FriendlyName:str=""
         self.InstanceId:str=""
@@ -47,7 +90,21 @@ class WinDevice(PowershellColonObject):
         self.PSComputerName:str=""
         self.CimClass:str=""
         self.CimInstanceProperties:str=""
-        PowershellColonObject.__init__(self,rawFromPowershell)
+        self._propsCache:typing.Optional[PowershellColonObjects]=None
+        if isinstance(rawFromPowershell,dict):
+            self.decodeJsonResult(rawFromPowershell)
+        else:
+            PowershellColonObject.__init__(self,rawFromPowershell)
+
+    def decodeJsonResult(self,
+        jsonResult:typing.Dict[str,typing.Any])->None:
+        """
+        Assign attributes from a ConvertTo-Json powershell result
+        """
+        for k,v in jsonResult.items():
+            if v is None:
+                v=""
+            setattr(self,k,v)
 
     @property
     def properties(self)->PowershellColonObjects:
@@ -59,9 +116,20 @@ class WinDevice(PowershellColonObject):
     def getProperties(self)->PowershellColonObjects:
         """
         Properties about the device
+
+        Fetched once per device, then remembered
+        (most properties never change while a device is plugged in)
+        """
+        if self._propsCache is None:
+            psCommand=f"Get-PnpDeviceProperty -InstanceID '{self.InstanceId}' | Select-Object *" # noqa: E501 # pylint: disable=line-too-long
+            self._propsCache=PowershellColonObjects(psCommand=psCommand)
+        return self._propsCache
+
+    def invalidateProperties(self)->None:
+        """
+        Force the next properties access to re-query the device
         """
-        psCommand=f"Get-PnpDeviceProperty -InstanceID '{self.InstanceId}' | Select-Object *" # noqa: E501 # pylint: disable=line-too-long
-        return PowershellColonObjects(psCommand=psCommand)
+        self._propsCache=None
 
     def reset(self,offTimeSec=1.0):
         """
@@ -80,14 +148,9 @@ class WinDevice(PowershellColonObject):
         https://learn.microsoft.com/en-us/powershell/module/pnpdevice/enable-pnpdevice?view=windowsserver2022-ps
         """
         psCmd=f"Enable-PnpDevice -Confirm:$false -InstanceID '{self.InstanceId}'"
-        cmd=['powershell','-Command',psCmd]
-        po=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        out,err=po.communicate()
-        errStr=err.decode('utf-8',errors='ignore').strip()
-        if errStr:
-            raise Exception(errStr)
-        outStr=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-        print(outStr)
+        print(_runPs(psCmd))
+        clearDeviceCache()
+        self.invalidateProperties()
     on=enable
 
     def disable(self):
@@ -100,21 +163,80 @@ class WinDevice(PowershellColonObject):
         https://learn.microsoft.com/en-us/powershell/module/pnpdevice/disable-pnpdevice?view=windowsserver2022-ps
         """
         psCmd=f"Disable-PnpDevice -Confirm:$false -InstanceID '{self.InstanceId}'"
-        cmd=['powershell','-Command',psCmd]
-        #print('\n'.join(cmd))
-        po=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        out,err=po.communicate()
+        print(_runPs(psCmd))
+        clearDeviceCache()
+        self.invalidateProperties()
+    off=disable
+
+    async def _runPsAsync(self,psCmd:str)->str:
+        """
+        Run a one-shot powershell command without blocking the event loop
+        """
+        proc=await asyncio.create_subprocess_exec(*PS_BASE,psCmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        out,err=await proc.communicate()
         errStr=err.decode('utf-8',errors='ignore').strip()
         if errStr:
             raise Exception(errStr)
-        outStr=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-        print(outStr)
-    off=disable
+        return out.decode('utf-8',errors='ignore').strip().replace('\r','')
+
+    async def enableAsync(self)->None:
+        """
+        Same as enable(), but awaitable so several devices
+        can be worked on at once
+        """
+        psCmd=f"Enable-PnpDevice -Confirm:$false -InstanceID '{self.InstanceId}'"
+        print(await self._runPsAsync(psCmd))
+        clearDeviceCache()
+        self.invalidateProperties()
+
+    async def disableAsync(self)->None:
+        """
+        Same as disable(), but awaitable so several devices
+        can be worked on at once
+        """
+        psCmd=f"Disable-PnpDevice -Confirm:$false -InstanceID '{self.InstanceId}'"
+        print(await self._runPsAsync(psCmd))
+        clearDeviceCache()
+        self.invalidateProperties()
+
+    async def resetAsync(self,offTimeSec:float=1.0)->None:
+        """
+        Same as reset(), but awaitable so several devices
+        can be power-cycled at once
+        """
+        await self.disableAsync()
+        await asyncio.sleep(offTimeSec)
+        await self.enableAsync()
 
     def __str__(self):
         return f'"{self.FriendlyName}" ({self.PNPClass}) @ {self.InstanceId}'
 
 
+def _decodeDevices(outStr:str)->typing.List[WinDevice]:
+    """
+    Decode a powershell device query result into WinDevice objects
+    (json when usePsJson is on, otherwise the colon-delimited format)
+    """
+    devices:typing.List[WinDevice]=[]
+    if usePsJson:
+        # each query emits one compressed json line
+        # (an object for one device, an array for several)
+        for line in outStr.split('\n'):
+            line=line.strip()
+            if not line or line[0] not in '[{':
+                continue
+            jsonResult=json.loads(line)
+            if isinstance(jsonResult,dict):
+                jsonResult=[jsonResult]
+            devices.extend(WinDevice(j) for j in jsonResult)
+    else:
+        for result in outStr.split('\n\n'):
+            devices.append(WinDevice(result))
+    return devices
+
+
 class WinDevices(PowershellColonObjects):
     """
     Info and utils about windows devices
@@ -188,22 +310,62 @@ class WinDevices(PowershellColonObjects):
         return self.getAll()
 
     def getByDeviceClass(self,
-        deviceClass:str,
+        deviceClass:typing.Union[str,typing.Iterable[str]],
         refresh:bool=False
         )->typing.Iterable[WinDevice]:
         """
         Get all devices of a certain device class (eg, "Ports")
+        (can be given several classes, which are all
+        fetched in a single powershell call)
         """
-        if refresh or not self._byDeviceClass:
-            self.refresh(deviceClass)
+        if isinstance(deviceClass,str):
+            deviceClasses=[deviceClass]
+        else:
+            deviceClasses=list(deviceClass)
+        if refresh:
+            self.refresh(deviceClasses)
         elif not self._scannedAll:
-            items=self._byDeviceClass.get(deviceClass)
-            if items is not None:
-                return items
-            self.refresh(deviceClass)
-        items=self._byDeviceClass.get(deviceClass,[])
+            missing:typing.List[str]=[]
+            now=time.monotonic()
+            for dc in deviceClasses:
+                if dc in self._byDeviceClass:
+                    continue
+                cached=_deviceCache.get(dc)
+                if cached is not None and now-cached[0]<deviceCacheTtlSec:
+                    # recent enough that re-enumerating isn't worth it
+                    self._byDeviceClass[dc]=list(cached[1])
+                    self.loadedClasses.add(dc)
+                else:
+                    missing.append(dc)
+            if missing:
+                self.refresh(missing)
+        items:typing.List[WinDevice]=[]
+        for dc in deviceClasses:
+            items.extend(self._byDeviceClass.get(dc,[]))
         return items
 
+    def resetAll(self,
+        devices:typing.Optional[typing.Iterable[WinDevice]]=None,
+        offTimeSec:float=1.0)->None:
+        """
+        Power-cycle several devices at the same time
+
+        Each reset spends nearly all of its time waiting on a
+        powershell child process, so running them concurrently
+        is a near-linear speedup in the number of devices.
+
+        :param devices: the devices to reset
+            (if None, resets all loaded devices)
+        """
+        if devices is None:
+            devices=list(self.getLoaded())
+        else:
+            devices=list(devices)
+        async def resetThemAll():
+            await asyncio.gather(
+                *[device.resetAsync(offTimeSec) for device in devices])
+        asyncio.run(resetThemAll())
+
     def refreshLoaded(self):
         """
         Refresh only the loaded deviceClass(es)
@@ -222,28 +384,35 @@ class WinDevices(PowershellColonObjects):
         """
         if deviceClass is None:
             self._scannedAll=True
-            psCmd='Get-PnPDevice | Select-Object *'
+            queries=['Get-PnPDevice | Select-Object *']
         elif not isinstance(deviceClass,str):
-            for dc in deviceClass:
-                self.refresh(dc)
-            return
+            # batch all of the classes into a single powershell call
+            # (each powershell.exe launch costs ~250ms-1s, so one
+            # big query beats one query per class)
+            deviceClasses=list(deviceClass)
+            if not deviceClasses:
+                return
+            self.loadedClasses.update(deviceClasses)
+            queries=[
+                f'Get-PnPDevice -Class {dc} | Select-Object *'
+                for dc in deviceClasses]
         else:
             self.loadedClasses.add(deviceClass)
-            psCmd=f'Get-PnPDevice -Class {deviceClass} | Select-Object *'
-        cmd=['powershell','-Command',psCmd]
-        po=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        out,err=po.communicate()
-        errStr=err.decode('utf-8',errors='ignore').strip()
-        if errStr:
-            raise Exception(errStr)
-        outStr=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-        for result in outStr.split('\n\n'):
-            dev=WinDevice(result)
+            queries=[f'Get-PnPDevice -Class {deviceClass} | Select-Object *']
+        if usePsJson:
+            queries=[
+                q+' | ConvertTo-Json -Compress -Depth 1' for q in queries]
+        outStr=_runPs('; '.join(queries))
+        for dev in _decodeDevices(outStr):
             lst=self._byDeviceClass.get(dev.PNPClass)
             if lst is None:
                 self._byDeviceClass[dev.PNPClass]=[dev]
             else:
                 lst.append(dev)
+        # share what we found with the module-level cache
+        now=time.monotonic()
+        for dc,devices in self._byDeviceClass.items():
+            _deviceCache[dc]=(now,list(devices))
 
     def __repr__(self):
         return '\n-----------------------\n'.join(
@@ -266,16 +435,11 @@ def getDevice(comOrInstanceId:str)->typing.Optional[WinDevice]:
                 return dev
         return None
     psCmd=f'Get-PnPDevice -InstanceId {comOrInstanceId} | Select-Object *'
-    cmd=['powershell','-Command',psCmd]
-    po=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    out,err=po.communicate()
-    errStr=err.decode('utf-8',errors='ignore').strip()
-    if errStr:
-        raise Exception(errStr)
-    outStr=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-    for result in outStr.split('\n\n'):
-        dev=WinDevice(result)
+    if usePsJson:
+        psCmd+=' | ConvertTo-Json -Compress -Depth 1'
+    for dev in _decodeDevices(_runPs(psCmd)):
         return dev
+    return None
 
 
 def cmdline(args:typing.Iterable[str])->int:
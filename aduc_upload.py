@@ -21,7 +21,11 @@ For more info on the protocol, see:
 """
 import typing
 import os
+import time
+import struct
+import asyncio
 import subprocess
+import collections
 from math import ceil
 from enum import Enum, auto
 try:
@@ -76,6 +80,21 @@ class AducStatus(Enum):
 StatusCB=typing.Callable[[AducStatus],None]
 PercentCB=typing.Callable[[float],None]
 
+# rotate-left-by-3 table for verify packets
+# (lets bytes.translate do the whole buffer in one C call)
+_VERIFY_SHIFT_TABLE=bytes((0xFF&(b<<3|b>>5)) for b in range(256))
+
+# the protocol's command characters, pre-encoded
+# (erase, write, verify, run)
+_CMD={'E':0x45,'W':0x57,'V':0x56,'R':0x52}
+
+# packet header packer (length + command + big-endian address)
+# bound once so per-packet calls skip the format-cache lookup
+_PACK_HEADER=struct.Struct('>BBI').pack
+
+# the characters allowed after the ':' in an intel hex record
+_HEX_DIGITS=frozenset(b'0123456789abcdefABCDEF')
+
 class StdoutCB:
     """
     default status output (dump to stdout)
@@ -84,25 +103,36 @@ class StdoutCB:
         self.percent=0
         self.status:str=""
         self.last:str=""
+        # don't repaint more often than this -- with large uploads
+        # the percent callback fires for every packet and console
+        # writes are surprisingly expensive
+        self.minPrintIntervalSec:float=0.1
+        self._lastPrintTime:float=0.0
+    def _repaint(self,force:bool=False)->None:
+        """
+        Redraw the status line (throttled unless forced)
+        """
+        now=time.monotonic()
+        if not force and now-self._lastPrintTime<self.minPrintIntervalSec:
+            return
+        current=str(self)+' '*20
+        if current!=self.last:
+            print(current,end="")
+            self.last=current
+            self._lastPrintTime=now
     def statusCB(self,status:AducStatus)->None:
         """
         Callback for a status state change
         """
         self.status=' '.join([
             word.lower() for word in str(status).rsplit('.',1)[-1].split('_')])
-        current=str(self)+' '*20
-        if current!=self.last:
-            print(current,end="")
-            self.last=current
+        self._repaint(force=True)
     def percentCB(self,percent:float)->None:
         """
         Callback for a percent complete change
         """
         self.percent=percent
-        current=str(self)+' '*20
-        if current!=self.last:
-            print(current,end="")
-            self.last=current
+        self._repaint(force=percent>=1.0)
     def __repr__(self):
         width=50
         full=int(width*self.percent)
@@ -110,6 +140,43 @@ class StdoutCB:
         return f'\r[{statusbar}] {self.status}'
 stdoutCB=StdoutCB()
 
+def _noopCB(_ignored:typing.Any)->None:
+    """
+    Stand-in for an unwanted status/percent callback, so the
+    per-packet loops can always call straight through without
+    an is-None check
+    """
+
+
+def elfFileToIhexFile(filename:str)->str:
+    """
+    Convert a .elf file into a .hex file
+    """
+    ihexFilename=filename.rsplit('.',1)[0]+'.hex'
+    if not os.path.exists(ihexFilename) \
+        or os.path.getmtime(filename)>os.path.getmtime(ihexFilename):
+        # (re)generate the ihexFilename file
+        cmd=['objcopy','-S','-O','ihex',filename,ihexFilename]
+        # known arg list, so no shell needed (shell=True with a
+        # list argument only ran 'objcopy' bare on posix anyway)
+        po=subprocess.run(cmd,capture_output=True,check=False)
+        errStr=po.stderr.decode('utf-8',errors='ignore').strip()
+        if po.returncode!=0 or errStr:
+            raise AducException('Error converting .elf to .hex: '+errStr)
+    return ihexFilename
+
+def loadIhex(filename:str)->intelhex.IntelHex:
+    """
+    Load an intel .hex file (converting from .elf first if necessary)
+
+    Needs no device connection, so callers that just want the parsed
+    hex don't have to construct an AducConnection to get it.
+    """
+    extn=filename.rsplit('.',1)[-1].lower()
+    if extn=='elf':
+        filename=elfFileToIhexFile(filename)
+    return intelhex.IntelHex(filename)
+
 
 class AducConnection:
     """
@@ -135,52 +202,94 @@ class AducConnection:
 
     def __init__(self,
         port:typing.Optional[str]=None,
+        # the loader autobauds from our first handshake byte, so a
+        # faster rate takes effect simply by opening the port with it
+        # (115200 is the fastest rate AN-724 guarantees; there is no
+        # change-baud command to renegotiate later)
         baudrate:int=115200,
         bytesize:int=8,
         parity:str='N',
         stopbits:float=1,
         xonxoff:int=0,
         rtscts:int=0,
-        statusCB:StatusCB=stdoutCB.statusCB,
-        percentCB:PercentCB=stdoutCB.percentCB
+        statusCB:typing.Optional[StatusCB]=stdoutCB.statusCB,
+        percentCB:typing.Optional[PercentCB]=stdoutCB.percentCB
         ):
         """
         If port is None, if there is only one available, use that
         otherwise ask using a dialog.
+
+        Pass statusCB=None and/or percentCB=None for quiet operation.
         """
-        if port is None:
-            import port_picker_ui
-            port=port_picker_ui.askForPort(dontAskIfOnlyOne=True)
-            if port is None:
-                raise Exception("There are no com ports.")
-        self.port:str=port
+        self.port:typing.Optional[str]=port
         self.baudrate=baudrate
         self.bytesize=bytesize
         self.parity=parity
         self.stopbits=stopbits
         self.timeout=0.01
+        # surface a wedged driver as an exception rather than
+        # blocking forever inside ser.write()
+        self.writeTimeout:float=1.0
+        # how long to wait for a packet's ack/nak before giving up
+        # (generous because a multi-page erase can take seconds
+        # before the device answers)
+        self.ackTimeout:float=5.0
         self.xonxoff=xonxoff
         self.rtscts=rtscts
         self.numTries:int=3
         self.pageSize=512
-        # According to AN-724 you can send up to 250 bytes per packet,
-        # but ARMWSD.exe only sends 16 for some reason
-        self.bytesPerWritePacket=16
-        self.statusCB:StatusCB=statusCB
-        self.percentCB:PercentCB=percentCB
+        # According to AN-724 you can send up to 250 bytes per packet
+        # (ARMWSD.exe only sends 16 for some reason, which costs ~15x
+        # the ack round-trips -- drop this back down if a device
+        # chokes on full-size packets)
+        self.bytesPerWritePacket=250
+        # how many write packets may be awaiting acks at once
+        # (1 = classic stop-and-wait)
+        self.windowSize:int=4
+        # ask the driver for low-latency delivery when connecting
+        # (usb-serial adapters often buffer rx for 16ms by default,
+        # which every 1-byte ack has to wait out)
+        self.lowLatency:bool=True
+        self.statusCB:StatusCB=statusCB if statusCB is not None else _noopCB
+        self.percentCB:PercentCB=\
+            percentCB if percentCB is not None else _noopCB
         self._connection:typing.Optional[serial.Serial]=None
         self._connectionEstablished=False
+        # page indices already erased (and not yet rewritten)
+        # this session, so overlapping segments don't re-erase
+        self._erasedPages:typing.Set[int]=set()
 
     def connect(self)->serial.Serial:
         """
         connect the serial port (called automatically as needed)
         """
         if not self._connection:
+            if self.port is None:
+                # deferred from __init__ so that simply constructing
+                # an AducConnection never scans ports or pops a dialog
+                import port_picker_ui
+                port=port_picker_ui.askForPort(dontAskIfOnlyOne=True)
+                if port is None:
+                    raise Exception("There are no com ports.")
+                self.port=port
             self.statusCB(AducStatus.CONNECTING)
             self.percentCB(0)
             self._connection=serial.Serial(
                 self.port,self.baudrate,self.bytesize,self.parity,
-                self.stopbits,self.timeout,self.xonxoff,self.rtscts)
+                self.stopbits,self.timeout,self.xonxoff,self.rtscts,
+                write_timeout=self.writeTimeout)
+            if self.lowLatency:
+                try:
+                    self._connection.set_low_latency_mode(True)
+                except (AttributeError,ValueError,NotImplementedError):
+                    pass # platform/driver can't do it; just run slower
+            try:
+                # larger driver buffers so fast baudrates don't
+                # stall in write() (win32 only)
+                self._connection.set_buffer_size(
+                    rx_size=64*1024,tx_size=64*1024)
+            except (AttributeError,NotImplementedError):
+                pass
         return self._connection
 
     def disconnect(self):
@@ -199,11 +308,25 @@ class AducConnection:
         self.disconnect()
         return self.connect()
 
-    def _checksum(self,data)->bytes:
+    def __enter__(self)->"AducConnection":
+        """
+        Use as a context manager to hold one connection
+        across several operations
+        """
+        return self
+
+    def __exit__(self,excType,excValue,excTraceback)->None:
+        self.disconnect()
+        self._connectionEstablished=False
+
+    def _checksum(self,data)->int:
         """
-        Calculate the checksum of a device packet
+        Calculate the checksum byte of a device packet
+
+        (sum() iterates the buffer at C speed, so this is one
+        interpreter call per packet rather than one per byte)
         """
-        return bytes([0xFF&(0-sum(data))])
+        return (-sum(data))&0xFF
 
     def waitForDevice(self)->bool:
         """
@@ -221,6 +344,10 @@ class AducConnection:
             if response and response[0] in (0x07,0x80):
                 self.statusCB(AducStatus.NOT_IN_FLASH_MODE)
         self.statusCB(AducStatus.DEVICE_FOUND)
+        # a fresh handshake can be a brand new physical device (eg the
+        # octopus swaps boards between uploads), so anything we knew
+        # about blank pages belonged to the old one
+        self._erasedPages.clear()
         self._connectionEstablished=True
         return True
 
@@ -234,33 +361,40 @@ class AducConnection:
             address-=0x0080000
         return address
 
-    def _sendPacket(self,command:str,address:int,data:bytes)->bool:
+    def _buildPacket(self,command:str,address:int,data:bytes)->bytes:
         """
-        Send a specified command packet to the device
+        Build a complete wire packet (magic + header + data + checksum)
         """
         address=self._remapAddress(address)
         packet_len=len(data)+5 # 1byte command + 4byte address + the data
         if packet_len>255:
             raise Exception('Packet size too large!')
-        magic:bytes=bytes([0x07,0x0E])
-        addr_bytes:bytes=address.to_bytes(
-            length=4,byteorder="big",signed=False)
-        sendbuf=bytearray(addr_bytes)
-        sendbuf.insert(0,command.encode('ascii')[0])
-        sendbuf.insert(0,packet_len)
-        sendbuf.extend(data)
-        checksum=self._checksum(sendbuf)
+        if not isinstance(data,bytes):
+            # accept any bytes-like chunk (eg a memoryview slice)
+            data=bytes(data)
+        # length + command + big-endian address in one C call
+        header=_PACK_HEADER(packet_len,_CMD[command],address)
+        # checksum the header and payload separately so no
+        # intermediate header+data buffer is needed
+        # (the magic bytes are not part of the checksum)
+        checksum=(-(sum(header)+sum(data)))&0xFF
+        return b'\x07\x0E'+header+data+bytes((checksum,))
+
+    def _readAck(self)->bool:
+        """
+        Read the device's one-byte ack/nak for a sent packet
+        """
         ser=self.connect()
-        # dispose of any lingering incoming junk
-        response=b'x'
-        while response:
-            response=ser.read(1)
-        # send it
-        ser.write(magic)
-        ser.write(sendbuf)
-        ser.write(checksum)
-        while not response:
+        # block at the os level until the byte shows up, instead of
+        # spinning on empty short-timeout reads
+        ser.timeout=self.ackTimeout
+        try:
             response=ser.read(1)
+        finally:
+            ser.timeout=self.timeout
+        if not response:
+            raise AducException(
+                'Device did not respond (waited %gs)'%self.ackTimeout)
         if response[0]==0x06: # device responded with success
             return True
         if response[0]==0x07: # device responded with fail
@@ -268,6 +402,21 @@ class AducConnection:
         i:int=response[0]
         raise AducException(f'Unexpected serial response: {hex(i)}')
 
+    def _sendPacket(self,command:str,address:int,data:bytes)->bool:
+        """
+        Send a specified command packet to the device
+        and wait for its ack/nak
+        """
+        packet=self._buildPacket(command,address,data)
+        ser=self.connect()
+        # dispose of any lingering incoming junk
+        # (one driver-level flush, not a per-byte read loop)
+        ser.reset_input_buffer()
+        # send it all in one go (magic + packet + checksum)
+        # so the driver sees a single write instead of three
+        ser.write(packet)
+        return self._readAck()
+
     def _erasePacket(self,address:int,numPages:int)->bool:
         """
         Send an erase packet to the device
@@ -289,7 +438,21 @@ class AducConnection:
         if numBytes<1:
             return True
         self.statusCB(AducStatus.ERASING)
-        ret=self._erasePacket(address,ceil(numBytes/self.pageSize))
+        # count pages from the containing page boundary, so a span
+        # that straddles page edges erases every page it touches
+        firstPage=address//self.pageSize
+        numPages=ceil((address%self.pageSize+numBytes)/self.pageSize)
+        needed=[page for page in range(firstPage,firstPage+numPages)
+            if page not in self._erasedPages]
+        if not needed:
+            # flash is a slow device -- skip pages already blank
+            self.statusCB(AducStatus.ERASE_SUCCEEDED)
+            self.percentCB(1.0)
+            return True
+        ret=self._erasePacket(
+            needed[0]*self.pageSize,needed[-1]-needed[0]+1)
+        if ret:
+            self._erasedPages.update(range(needed[0],needed[-1]+1))
         if not ret:
             self.statusCB(AducStatus.ERASE_FAILED)
         else:
@@ -306,6 +469,7 @@ class AducConnection:
             lose config data section too!
         """
         self.statusCB(AducStatus.ERASING)
+        self._erasedPages.clear()
         ret=self._erasePacket(0x00000000,0x00)
         if not ret:
             self.statusCB(AducStatus.ERASE_FAILED)
@@ -320,10 +484,13 @@ class AducConnection:
         Send a write packet to the device
         """
         ret=False
-        for _ in range(self.numTries):
+        for attempt in range(self.numTries):
             ret=self._sendPacket('W',address,data)
             if ret:
                 break
+            # nak: back off briefly so a line glitch isn't hammered
+            # (timeouts and garbage responses raise out immediately)
+            time.sleep(0.002*(1<<attempt))
         return ret
 
     def write(self,address:int,data:bytes,
@@ -349,18 +516,54 @@ class AducConnection:
             self.erase(address,total)
         self.statusCB(AducStatus.WRITING)
         self.percentCB(0.0)
-        while complete<total:
-            numWritten=min(total-complete,self.bytesPerWritePacket)
-            chunk:bytes=bytes(data[complete:complete+numWritten])
-            while len(chunk)<self.bytesPerWritePacket:
-                chunk=chunk+bytes([0x00])
-            ret=self._writePacket(address,chunk)
-            if not ret:
-                self.statusCB(AducStatus.WRITE_FAILED)
-                return ret
-            self.percentCB(complete/total)
-            complete+=numWritten
-            address+=numWritten
+        ser=self.connect()
+        ser.reset_input_buffer()
+        acked=0
+        # keep up to windowSize packets in flight at once so the
+        # device can chew on one packet while the next is still
+        # travelling down the wire (set windowSize=1 for strict
+        # stop-and-wait behavior)
+        pending:typing.Deque[typing.Tuple[int,typing.Any,int]]= \
+            collections.deque()
+        # slicing a memoryview is zero-copy, so each chunk costs
+        # nothing until it's framed for the wire
+        mv=memoryview(data)
+        while complete<total or pending:
+            while complete<total and len(pending)<self.windowSize:
+                numWritten=min(total-complete,self.bytesPerWritePacket)
+                # the short final chunk goes out unpadded -- AN-724
+                # write packets may carry any 1-250 bytes, and padding
+                # would program zeros past the end of the data into a
+                # page erase() never touched (eg the config section)
+                chunk=mv[complete:complete+numWritten]
+                ser.write(self._buildPacket('W',address,chunk))
+                pending.append((address,chunk,numWritten))
+                complete+=numWritten
+                address+=numWritten
+            sentAddress,sentChunk,numSent=pending.popleft()
+            if self._readAck():
+                acked+=numSent
+            else:
+                # the device refused a packet -- collect the acks for
+                # everything else in flight, then retry the failures
+                # one at a time
+                failed=[(sentAddress,sentChunk,numSent)]
+                while pending:
+                    inflight=pending.popleft()
+                    if self._readAck():
+                        acked+=inflight[2]
+                    else:
+                        failed.append(inflight)
+                for failedAddress,failedChunk,numFailed in failed:
+                    if not self._writePacket(failedAddress,failedChunk):
+                        self.statusCB(AducStatus.WRITE_FAILED)
+                        return False
+                    acked+=numFailed
+            self.percentCB(acked/total)
+        # written pages are no longer blank
+        self._erasedPages.difference_update(range(
+            startAddress//self.pageSize,
+            (startAddress+total-1)//self.pageSize+1))
         self.statusCB(AducStatus.WRITE_SUCCEEDED)
         self.percentCB(1.0)
         if andVerify:
@@ -369,8 +572,11 @@ class AducConnection:
             self.run()
         elif andReset:
             self.reset()
-        self.disconnect()
         if weConnected:
+            # only tear down what we set up -- if the caller opened
+            # the connection, leave it open so a follow-up verify or
+            # re-upload doesn't pay the port setup cost again
+            self.disconnect()
             self._connectionEstablished=False
         return ret
 
@@ -378,27 +584,13 @@ class AducConnection:
         """
         Convert a .elf file into a .hex file
         """
-        ihexFilename=filename.rsplit('.',1)[0]+'.hex'
-        if not os.path.exists(ihexFilename) \
-            or os.path.getmtime(filename)>os.path.getmtime(ihexFilename):
-            # (re)generate the ihexFilename file
-            cmd=['objcopy','-S','-O','ihex',filename,ihexFilename]
-            po=subprocess.Popen(cmd,shell=True,
-                stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-            _,err=po.communicate()
-            errStr=err.decode('utf-8',errors='ignore').strip()
-            if errStr:
-                raise AducException('Error converting .elf to .hex: '+errStr)
-        return ihexFilename
+        return elfFileToIhexFile(filename)
 
     def loadIhex(self,filename:str)->intelhex.IntelHex:
         """
         Load an intel .hex file
         """
-        extn=filename.rsplit('.',1)[-1].lower()
-        if extn=='elf':
-            filename=self._elfFileToIhexFile(filename)
-        return intelhex.IntelHex(filename)
+        return loadIhex(filename)
 
     def upload(self,
         filename:str,
@@ -416,23 +608,15 @@ class AducConnection:
         """
         determine if the data looks like intel hex format
         """
-        if len(data)>=10:
-            asc=data[0:10].decode('ascii')
-            if asc[0]==':':
-                import re
-                exp=r':[0-9A-Fa-f]{2}\s+[[0-9A-Fa-f]{4,99}'
-                if re.match(exp,asc) is not None:
-                    return True
-        return False
+        if len(data)<10 or data[0]!=0x3A: # ':'
+            return False
+        return all(c in _HEX_DIGITS for c in data[1:9])
 
     def _looksLikeElf(self,data:bytes)->bool:
         """
         determine if the data looks like elf format
         """
-        if len(data)>=4:
-            asc=data[1:4].decode('ascii')
-            return asc==b'ELF'
-        return False
+        return data[:4]==b'\x7fELF'
 
     def uploadData(self,
         data:bytes,decodeAs:typing.Optional[str]=None,
@@ -471,29 +655,65 @@ class AducConnection:
         """
         Upload an intel hex object to the device
         """
+        # pull each segment's data out of the ihex exactly once
+        # (tobinstr gives plain bytes with no intermediate array,
+        # which write() can then slice as zero-copy memoryviews --
+        # NOTE: size= because tobinstr's end argument is inclusive)
+        segments=[(start,stop,ihex.tobinstr(start,size=stop-start))
+            for start,stop in ihex.segments()]
+        return self.uploadSegments(segments,andVerify,andRun,andReset,postRun)
+
+    def uploadSegments(self,
+        segments:typing.Iterable[typing.Tuple[int,int,bytes]],
+        andVerify:bool=True,andRun:bool=False,andReset:bool=False,
+        postRun:typing.Optional[str]=None
+        )->bool:
+        """
+        Upload pre-flattened (start,stop,data) segments to the device
+
+        When the same image goes to many devices, flatten the ihex
+        once and hand the shared immutable buffers to every
+        connection rather than re-serializing per upload.
+        """
         ret=True
         if postRun is not None:
             postRun=postRun.strip()
             if not postRun:
                 postRun=None
         self.waitForDevice()
+        segments=list(segments)
         totalbytes=0
-        for start,stop in ihex.segments():
+        for start,stop,_ in segments:
             totalbytes+=stop-start
-        # erase
-        for start,stop in ihex.segments():
-            self.erase(start,stop-start)
-        # write
+        # erase every page any segment touches BEFORE any data lands:
+        # two segments can share a flash page, and erasing per segment
+        # would blank that page again after an earlier segment was
+        # already written into it
+        # (erase() skips pages already blanked, so a shared page still
+        # only costs one erase)
+        for start,stop,_ in segments:
+            if not self.erase(start,stop-start):
+                return False
         uploaded=0
-        for start,stop in ihex.segments():
-            amt=stop-start
-            # wait until after this loop to do run/reset
-            # in case there is more than 1 segment
-            ret=self.write(start,ihex.tobinarray(start,stop),
-                andVerify,False,False,noErase=True)
-            if not ret:
-                break
-            uploaded+=amt
+        origPercentCB=self.percentCB
+        try:
+            for start,stop,segmentData in segments:
+                amt=stop-start
+                if totalbytes>0:
+                    # remap this segment's 0..1 progress into overall
+                    # progress so the bar doesn't restart per segment
+                    self.percentCB=lambda pct,_done=uploaded,_amt=amt: \
+                        origPercentCB((_done+pct*_amt)/totalbytes)
+                # wait until after this loop to do run/reset
+                # in case there is more than 1 segment
+                # (noErase because everything was erased up front)
+                ret=self.write(start,segmentData,
+                    andVerify,False,False,noErase=True)
+                if not ret:
+                    break
+                uploaded+=amt
+        finally:
+            self.percentCB=origPercentCB
         if ret:
             if andRun:
                 ret=self.run()
@@ -505,11 +725,16 @@ class AducConnection:
             # run whatever the postRun shell command is
             self.statusCB(AducStatus.POST_STEP)
             self.percentCB(0.0)
+            # (still shell=True because postRun is a user shell command,
+            # but stream the output as it happens instead of buffering
+            # everything until the command finishes)
             po=subprocess.Popen(postRun,shell=True,
-                stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
-            out,_=po.communicate()
-            print(out.decode('utf-8',errors='ignore').strip())
-            ret=po.returncode!=0
+                stdout=subprocess.PIPE,stderr=subprocess.STDOUT,
+                text=True,bufsize=1)
+            for line in po.stdout:
+                print(line,end='')
+            po.wait()
+            ret=po.returncode==0
             if ret:
                 self.statusCB(AducStatus.POST_STEP_SUCCEEDED)
                 self.percentCB(1.0)
@@ -523,17 +748,24 @@ class AducConnection:
         Send a verify packet to the device
         """
         ret=False
-        for _ in range(self.numTries):
+        for attempt in range(self.numTries):
             ret=self._sendPacket('V',address,data)
             if ret:
                 break
+            # nak: back off briefly so a line glitch isn't hammered
+            # (timeouts and garbage responses raise out immediately)
+            time.sleep(0.002*(1<<attempt))
         return ret
 
     def _verifyShift(self,data:bytes)->bytes:
         """
         When doing a verify, the bits are rotate-shifted
+
+        Uses a precomputed lookup table so the whole buffer
+        (which can be the entire firmware image) is translated
+        in a single C call instead of a python loop.
         """
-        return bytes([0xFF & (b << 3 | b >> 5) for b in data])
+        return bytes(data).translate(_VERIFY_SHIFT_TABLE)
 
     def verify(self,
         address:int,
@@ -543,7 +775,9 @@ class AducConnection:
         Verify some data
         """
         ret=True
-        data=self._verifyShift(data)
+        # shift chunk-by-chunk inside the loop rather than all at
+        # once, so a large image never needs a second full-size copy
+        data=memoryview(data)
         complete=0
         total=len(data)
         weConnected=self._connectionEstablished is False
@@ -553,7 +787,7 @@ class AducConnection:
         self.percentCB(0.0)
         while complete<total:
             numVerified=min(total-complete,self.bytesPerWritePacket)
-            chunk=data[complete:complete+numVerified]
+            chunk=self._verifyShift(data[complete:complete+numVerified])
             ret=self._verifyPacket(address,chunk)
             if not ret:
                 self.statusCB(AducStatus.VERIFY_FAILED)
@@ -573,10 +807,13 @@ class AducConnection:
         Send a run command packet
         """
         ret=False
-        for _ in range(self.numTries):
+        for attempt in range(self.numTries):
             ret=self._sendPacket('R',address,bytes())
             if ret:
                 break
+            # nak: back off briefly so a line glitch isn't hammered
+            # (timeouts and garbage responses raise out immediately)
+            time.sleep(0.002*(1<<attempt))
         return ret
 
     def run(self)->bool:
@@ -638,6 +875,51 @@ def uploadBytes(
         andVerify=andVerify,andRun=andRun,andReset=andReset)
 
 
+async def uploadAsync(
+    filename:str,
+    port:str,
+    andVerify=True,
+    andRun=False,
+    andReset=False
+    )->bool:
+    """
+    Awaitable version of upload()
+
+    The blocking serial protocol runs on a worker thread, so an
+    event loop can drive many boards at once.
+    """
+    loop=asyncio.get_running_loop()
+    def doUpload()->bool:
+        connection=AducConnection(port,statusCB=None,percentCB=None)
+        return connection.upload(filename,
+            andVerify=andVerify,andRun=andRun,andReset=andReset)
+    return await loop.run_in_executor(None,doUpload)
+
+
+def uploadMany(
+    filename:str,
+    ports:typing.Iterable[str],
+    andVerify=True,
+    andRun=False,
+    andReset=False
+    )->typing.Dict[str,bool]:
+    """
+    Upload the same file to several boards at the same time.
+
+    Since the protocol is almost entirely waiting on the wire,
+    N boards take roughly the time of 1.
+
+    Returns {port: succeeded}
+    """
+    ports=list(ports)
+    async def uploadThemAll()->typing.List[bool]:
+        return list(await asyncio.gather(*[
+            uploadAsync(filename,port,
+                andVerify=andVerify,andRun=andRun,andReset=andReset)
+            for port in ports]))
+    return dict(zip(ports,asyncio.run(uploadThemAll())))
+
+
 def cmdline(args:typing.Iterable[str])->int:
     """
     Run the command line
@@ -649,6 +931,7 @@ def cmdline(args:typing.Iterable[str])->int:
     printhelp=False
     filename=''
     port=None
+    baudrate=115200
     andVerify=True
     andRun=False
     andReset=False
@@ -663,6 +946,8 @@ def cmdline(args:typing.Iterable[str])->int:
                 printhelp=True
             elif av[0]=='--port':
                 port=av[1].strip()
+            elif av[0]=='--baud':
+                baudrate=int(av[1].strip())
             elif av[0]=='--verify':
                 andVerify=len(av)<2 or av[1][0].lower() in ('t','y','1')
             elif av[0]=='--run':
@@ -679,7 +964,7 @@ def cmdline(args:typing.Iterable[str])->int:
             filename=arg
     if not printhelp and (filename or massEraseFirst):
         print()
-        aduc=AducConnection(port)
+        aduc=AducConnection(port,baudrate=baudrate)
         if massEraseFirst:
             worked=aduc.massErase()
         if worked:
@@ -703,6 +988,8 @@ def cmdline(args:typing.Iterable[str])->int:
         print('         (what your os calls it, eg "COM1" or "/dev/ttyS0")')
         print('         if not specified, will take whatever port is availble')
         print('         or ask if there is more than one')
+        print('  --baud= .......... serial baudrate (default = 115200)')
+        print('         (the device autobauds from the first handshake byte)')
         print('  --run[=t/f]  ..... auto-run after uploading (default=f)')
         print('  --reset[=t/f]  ... reset device after uploading (default=f)')
         print('  --verify[=t/f]  .. verify after uploading (default = t)')
@@ -4,9 +4,11 @@ devices to the same image all at the same time!
 """
 import typing
 import os
+import re
 import threading
-import queue
 import time
+import collections
+import concurrent.futures
 import tkinter as tk
 import tkinter.ttk as ttk
 import intelhex # type: ignore
@@ -17,7 +19,16 @@ except ImportError as e:
     print('pyserial not found.  Try something like:')
     print('    pip install pyserial')
     raise e
-from aduc_upload import AducConnection,AducStatus
+from aduc_upload import AducConnection,AducStatus,loadIhex
+
+# collapse runs of whitespace (including newlines) in error messages
+_WHITESPACE_RE=re.compile(r'\s+')
+
+_ICON_PATH=os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),'octopus.ico')
+
+# separators allowed between port names on the command line
+_PORT_SPLIT=re.compile(r'[,\s]+')
 
 class PortStatusMessage:
     """
@@ -48,17 +59,25 @@ class PortStatusComponent(tk.LabelFrame):
         """ """
         self.name=portName
         tk.LabelFrame.__init__(self,root,text=portName,padding=5)
-        self.statusVar=tk.StringVar(root,'Initializing...')
-        self.statusControl=ttk.Label(self,textvariable=self.statusVar)
+        self.statusControl=ttk.Label(self,text='Initializing...')
         self.statusControl.pack(expand=True, fill='x')
         self.progressControl=ttk.Progressbar(self,length=100)
         self.progressControl.pack(expand='yes', fill='x')
         #self.pack(expand='yes', fill='x')
         self._progress=0.0
         self._status=''
+        self._lastProgressSent=-1.0
+        self._lastProgressTs=0.0
+        # latest-value slots the ui reads on drain -- producers just
+        # overwrite, so bursts never pile up messages behind the ui
+        self._pendingProgress:typing.Optional[float]=None
+        self._pendingStatus:typing.Optional[str]=None
+        self._lastShownPct=-1
+        self._lastShownStatus='Initializing...'
+        self._lastStatusEnum:typing.Optional[AducStatus]=None
         self.portComponents=portComponents
-        self._threadExit=False
-        self._thread:typing.Optional[threading.Thread]=None
+        self._exitEvent=threading.Event()
+        self._future:typing.Optional[concurrent.futures.Future]=None
         self.start()
 
     @property
@@ -68,6 +87,13 @@ class PortStatusComponent(tk.LabelFrame):
         """
         return self.portComponents.ihex
 
+    @property
+    def flatSegments(self)->typing.List[typing.Tuple[int,int,bytes]]:
+        """
+        current data flattened to (start,stop,data) tuples
+        """
+        return self.portComponents.flatSegments
+
     @property
     def postRun(self)->str:
         """
@@ -79,17 +105,20 @@ class PortStatusComponent(tk.LabelFrame):
 
     def start(self):
         """
-        Start the thread (called automatically on creation)
+        Start the worker (called automatically on creation)
         """
-        if self._thread is None:
-            self._threadExit=False
-            self._thread=threading.Thread(target=self.run)
-            self._thread.start()
+        if self._future is None:
+            self._exitEvent.clear()
+            self._future=self.portComponents._executor.submit(self.run) # pylint: disable=protected-access # noqa: E501
 
     def _statusCB(self,status:AducStatus)->None:
         """
         callback from the uploader itself
         """
+        if status is self._lastStatusEnum:
+            # same enum as last tick -- nothing to format or send
+            return
+        self._lastStatusEnum=status
         self.status=str(status)
     def _percentCB(self,percent:float)->None:
         """
@@ -103,14 +132,14 @@ class PortStatusComponent(tk.LabelFrame):
         """
         connection=AducConnection(
             port=self.name,statusCB=self._statusCB,percentCB=self._percentCB)
-        while not self._threadExit:
+        while not self._exitEvent.is_set():
             try:
-                connection.uploadIhex(
-                    self.ihex,andVerify=True,andReset=True,
+                connection.uploadSegments(
+                    self.flatSegments,andVerify=True,andReset=True,
                     postRun=self.postRun)
             except Exception as e:
                 print(e)
-                status=str(e).replace('\n',' ').replace('  ',' ')
+                status=_WHITESPACE_RE.sub(' ',str(e))
                 if len(status)>50:
                     status=status[0:47]+'...'
                 self.status=status
@@ -118,29 +147,37 @@ class PortStatusComponent(tk.LabelFrame):
                     # time delay so the user can see there was a problem
                     # use the progress bar as a count-down
                     self.progress=1.0-i/10
-                    time.sleep(1)
+                    if self._exitEvent.wait(1.0):
+                        # stop() was called -- bail out now rather
+                        # than holding the thread for the countdown
+                        break
                 #raise e
 
     def stop(self):
         """
-        stop the thread
+        stop the worker
         """
-        if self._thread is not None:
-            self._threadExit=True
-            self._thread.join()
-            self._thread=None
+        if self._future is not None:
+            self._exitEvent.set()
+            self._future.result()
+            self._future=None
 
     def _setUiStatus(self,value:str):
         """
         runs in the ui thread to actually update the component
         """
-        self.statusVar.set(str(value))
+        # set the label text directly -- no tcl variable and its
+        # trace machinery in between -- and skip unchanged values
+        value=str(value)
+        if value!=self._lastShownStatus:
+            self._lastShownStatus=value
+            self.statusControl.configure(text=value)
 
     def getStatus(self)->str:
         """
         Get the status message
         """
-        return self._progress
+        return self._status
     @property
     def status(self)->str:
         """
@@ -152,10 +189,12 @@ class PortStatusComponent(tk.LabelFrame):
         """
         Set the status message
         """
+        if type(status) is not str: # pylint: disable=unidiomatic-typecheck # noqa: E501
+            status=str(status)
         if self._status!=status:
             self._status=status
-            msg=PortStatusMessage(self.name,status=str(status))
-            self.portComponents._messageQueue.put(msg) # pylint: disable=protected-access # noqa: E501
+            self._pendingStatus=status
+            self.portComponents._notifyUi() # pylint: disable=protected-access # noqa: E501
     @status.setter
     def status(self,status:str):
         """
@@ -167,7 +206,12 @@ class PortStatusComponent(tk.LabelFrame):
         """
         runs in the ui thread to actually update the component
         """
-        self.progressControl['value']=progress*100
+        # the bar only resolves whole percents, so skip the tcl
+        # round-trip when the shown value wouldn't change
+        pct=int(progress*100)
+        if pct!=self._lastShownPct:
+            self._lastShownPct=pct
+            self.progressControl.configure(value=pct)
 
     def getProgress(self)->float:
         """
@@ -185,11 +229,22 @@ class PortStatusComponent(tk.LabelFrame):
         """
         Set the progress bar progress
         """
-        progress=min(progress,1.0)
+        # clamp both ends -- a negative value would throw in tcl
+        progress=0.0 if progress<0.0 else (
+            1.0 if progress>1.0 else progress)
         if self._progress!=progress:
             self._progress=progress
-            msg=PortStatusMessage(self.name,progress=progress)
-            self.portComponents._messageQueue.put(msg) # pylint: disable=protected-access # noqa: E501
+            # the uploader calls this for every packet -- don't flood
+            # the ui with updates the progress bar can't even show
+            now=time.monotonic()
+            if progress<1.0 \
+                and abs(progress-self._lastProgressSent)<0.005 \
+                and now-self._lastProgressTs<0.1:
+                return
+            self._lastProgressSent=progress
+            self._lastProgressTs=now
+            self._pendingProgress=progress
+            self.portComponents._notifyUi() # pylint: disable=protected-access # noqa: E501
     @progress.setter
     def progress(self,progress:float):
         """
@@ -216,13 +271,27 @@ class PortComponents:
             ignorePorts=[]
         self.ignorePorts=list(ignorePorts)
         self._ihex:typing.Optional[intelhex.IntelHex]=None
+        self._flatSegments:typing.List[
+            typing.Tuple[int,int,bytes]]=[]
         self._lastFileReadTimestamp:typing.Optional[typing.Any]=None
         self._lastFileReadSize:typing.Optional[typing.Any]=None
+        # every worker thread hits the ihex property inside its upload
+        # loop, so guard the cache with a lock (one parse, not one per
+        # port) and don't even re-stat the file more than once a second
+        self._ihexLock=threading.Lock()
+        self._lastFileStatTime:float=0.0
+        self.fileCheckIntervalSec:float=1.0
         self._components:typing.Dict[str,PortStatusComponent]={}
-        self._messageQueue:queue.Queue[PortStatusMessage]=\
-            queue.Queue[PortStatusMessage]()
+        # one shared pool for all port workers rather than a
+        # dedicated thread (and its stack) per port
+        self._executor=concurrent.futures.ThreadPoolExecutor(
+            max_workers=32,thread_name_prefix='octopus_port')
+        # deque append/popleft are atomic in cpython, so the single
+        # ui consumer needs no lock handshake with the producers
+        self._messageQueue:typing.Deque[PortStatusMessage]=\
+            collections.deque()
         self.extend(portNames)
-        self._threadExit=False
+        self._exitEvent=threading.Event()
         self._thread:typing.Optional[threading.Thread]=None
         self.start()
 
@@ -238,43 +307,86 @@ class PortComponents:
             versions properly.
             Use .hex files if you want to downgrade versions!
         """
-        timestamp=os.path.getmtime(self.filename)
-        size=os.path.getsize(self.filename)
-        if self._ihex is None \
-            or self._lastFileReadTimestamp!=timestamp \
-            or size!=self._lastFileReadSize:
-            #
-            tmpConn=AducConnection()
-            self._ihex=tmpConn.loadIhex(self.filename)
-            self._lastFileReadSize=size
-            self._lastFileReadTimestamp=timestamp
-        return self._ihex
+        with self._ihexLock:
+            now=time.monotonic()
+            if self._ihex is not None \
+                and now-self._lastFileStatTime<self.fileCheckIntervalSec:
+                # answered recently -- don't re-stat on every access
+                return self._ihex
+            self._lastFileStatTime=now
+            timestamp=os.path.getmtime(self.filename)
+            size=os.path.getsize(self.filename)
+            if self._ihex is None \
+                or self._lastFileReadTimestamp!=timestamp \
+                or size!=self._lastFileReadSize:
+                #
+                self._ihex=loadIhex(self.filename)
+                # flatten to immutable (start,stop,bytes) tuples once
+                # so every port shares the same buffers instead of
+                # re-walking the ihex internals per upload
+                # (size= because tobinstr's end argument is inclusive)
+                self._flatSegments=[
+                    (start,stop,self._ihex.tobinstr(start,size=stop-start))
+                    for start,stop in self._ihex.segments()]
+                self._lastFileReadSize=size
+                self._lastFileReadTimestamp=timestamp
+            return self._ihex
+
+    @property
+    def flatSegments(self)->typing.List[typing.Tuple[int,int,bytes]]:
+        """
+        hex data flattened to (start,stop,data) tuples
+
+        The bytes objects are immutable, so workers on every port can
+        share them without copying.
+        """
+        _=self.ihex # make sure the cache is current
+        return self._flatSegments
 
     def start(self):
         """
         Start the thread (called automatically on creation)
         """
         if self._thread is None:
-            self._threadExit=False
-            self.thread=threading.Thread(target=self.run)
-            self.thread.start()
+            self._exitEvent.clear()
+            self._thread=threading.Thread(target=self.run)
+            self._thread.start()
 
     def run(self):
         """
         main loop of the thread
         """
-        while not self._threadExit:
+        lastPorts:typing.FrozenSet[str]=frozenset()
+        while not self._exitEvent.is_set():
             newlist=[x.name for x in serial.tools.list_ports.comports()]
-            msg=PortStatusMessage(assignPortsList=newlist)
-            self._messageQueue.put(msg)
-            time.sleep(30)
+            newPorts=frozenset(newlist)
+            if newPorts!=lastPorts:
+                # only wake the ui when something actually changed
+                lastPorts=newPorts
+                msg=PortStatusMessage(assignPortsList=newlist)
+                self._messageQueue.append(msg)
+                self._notifyUi()
+            # re-check every 30s, but wake immediately on stop()
+            self._exitEvent.wait(30)
+
+    def _notifyUi(self)->None:
+        """
+        Poke the ui thread to drain the message queue now
+        (event_generate is safe to call from worker threads)
+        """
+        try:
+            self.root.event_generate('<<PortMsg>>',when='tail')
+        except Exception:
+            # the window may not be fully built yet (or already torn
+            # down) -- the fallback poll timer will pick the message up
+            pass
 
     def stop(self):
         """
         stop the thread
         """
         if self._thread is not None:
-            self._threadExit=True
+            self._exitEvent.set()
             self._thread.join()
             self._thread=None
 
@@ -317,20 +429,20 @@ class PortComponents:
         """
         Assign this to exactly equal a series of ports
         """
-        ret=[]
         if portNames is None:
-            portNames=[]
+            portNames=()
         elif isinstance(portNames,str):
             portNames=(portNames,)
-        stuffToRemove=[]
-        for k in self._components:
-            if k not in portNames:
-                stuffToRemove.append(k)
-        for k in stuffToRemove:
-            self.remove(k)
-        for pn in portNames:
-            ret.append(self.add(pn))
-        return ret
+        # normalize once and let set algebra find the differences
+        # rather than nested membership loops
+        desired=frozenset(portNames).difference(self.ignorePorts)
+        current=set(self._components)
+        for pn in current-desired:
+            self.remove(pn)
+        for pn in desired-current:
+            self.add(pn)
+        return [self._components[pn]
+            for pn in desired if pn in self._components]
 
     def remove(self,portName:str)->None:
         """
@@ -358,29 +470,45 @@ class OctopusWindow(tk.Tk,PortComponents):
         tk.Tk.__init__(self)
         self.title('octopus')
         self.geometry('250x800')
-        self.iconbitmap(os.sep.join((
-            os.path.abspath(__file__).rsplit(os.sep,1)[0],
-            "octopus.ico")))
+        if os.path.isfile(_ICON_PATH):
+            self.iconbitmap(_ICON_PATH)
+        # messages are normally drained the moment a worker posts one;
+        # the poll timer is just a low-rate safety net
+        self.bind('<<PortMsg>>',lambda _:self._drainQueue())
         self._pollQueue()
 
     def _pollQueue(self):
+        """
+        fallback timer in case a <<PortMsg>> event ever gets lost
+        """
+        self._drainQueue()
+        # run again in a second
+        self.after(1000,self._pollQueue)
+
+    def _drainQueue(self):
         """
         grab things from the message queue and update the ui as necessary
         """
         try:
+            # (per-port progress/status travel in each component's
+            # pending slots now -- only port list changes come this way)
             while True:
-                msg:PortStatusMessage=self._messageQueue.get_nowait()
+                msg:PortStatusMessage=self._messageQueue.popleft()
                 if msg.assignPortsList is not None:
                     self.assign(msg.assignPortsList)
-                elif msg.portName in self._components:
-                    if msg.progress is not None:
-                        self._components[msg.portName]._setUiProgress(msg.progress) # pylint: disable=protected-access # noqa: E501
-                    if msg.status is not None:
-                        self._components[msg.portName]._setUiStatus(msg.status) # pylint: disable=protected-access # noqa: E501
-        except queue.Empty:
+        except IndexError:
             pass # it took us out of the loop, so it did its job
-        # run again in a quarter second
-        self.after(250,self._pollQueue)
+        for comp in list(self._components.values()):
+            progress=comp._pendingProgress # pylint: disable=protected-access # noqa: E501
+            if progress is not None:
+                comp._pendingProgress=None # pylint: disable=protected-access # noqa: E501
+                comp._setUiProgress(progress) # pylint: disable=protected-access # noqa: E501
+            status=comp._pendingStatus # pylint: disable=protected-access # noqa: E501
+            if status is not None:
+                comp._pendingStatus=None # pylint: disable=protected-access # noqa: E501
+                comp._setUiStatus(status) # pylint: disable=protected-access # noqa: E501
+        # flush all the display changes from this drain as one frame
+        self.update_idletasks()
 
 
 def cmdline(args:typing.Iterable[str])->int:
@@ -395,14 +523,15 @@ def cmdline(args:typing.Iterable[str])->int:
     ignorePorts:typing.List[str]=[]
     for arg in args:
         if arg.startswith('-'):
-            av=arg.split('=',1)
-            av[0]=av[0].lower()
-            if av[0] in ('-h','--help'):
+            key,_,val=arg.partition('=')
+            key=key.lower()
+            if key in ('-h','--help'):
                 printhelp=True
-            elif av[0]=='--postrun':
-                postRun=av[1]
-            if av[0] in ('--ignore','--ignoreports'):
-                ignorePorts.extend(av[1].replace(' ','').split(','))
+            elif key=='--postrun':
+                postRun=val
+            elif key in ('--ignore','--ignoreports'):
+                ignorePorts.extend(
+                    p for p in _PORT_SPLIT.split(val) if p)
             else:
                 printhelp=True
         else:
@@ -3,27 +3,34 @@ EXPERIMENTAL tool to enumerate over windows devices
 and determine what ports are in use
 """
 import typing
+import io
+import csv
+import re
 import subprocess
 import win32file # type: ignore
 
+# tasklist memory figures look like "1,234 K"
+_MEM_RE=re.compile(r'([\d,]+)\s*([KMG]?)')
+_MEM_MULT={'':1,'K':1000,'M':1000**2,'G':1000**3}
+
 
 def processUsingPort(port:str)->str:
     """
     NOTE: Works on Windows only
     """
     port=port[3:]
-    def queryall(portType:str):
-        try:
-            for n in range(1000):
-                dev=f'\\Device\\{portType}{n}'
-                print(dev)
+    # one bulk call returns every dos device name (double-null
+    # separated) instead of probing 1000 numbered names per type
+    # with a syscall apiece
+    allNames=win32file.QueryDosDevice(None).split('\x00') # pylint: disable=c-extension-no-member # noqa: E501
+    for dev in allNames:
+        if dev.startswith(('Serial','VCP','Silabser')):
+            print(dev)
+            try:
                 p=win32file.QueryDosDevice(dev)# pylint: disable=c-extension-no-member # noqa: E501
                 print(p)
-        except Exception as e:
-            print(e)
-    queryall('Serial')
-    queryall('VCP')
-    queryall('Silabser')
+            except Exception as e:
+                print(e)
 
 
 def processes(processName:str='PuTTY.exe'):
@@ -35,15 +42,15 @@ def processes(processName:str='PuTTY.exe'):
     po=subprocess.Popen(cmd,stdout=subprocess.PIPE)
     out,_=po.communicate()
     if out.find(b'No tasks are running')<0:
-        for line in out.decode('utf-8',errors='ignore').strip().split('\n'):
-            line=line.strip()[1:-1].split('","')
-            mem=line[4]\
-                .replace(',','')\
-                .replace(' ','')\
-                .replace('K','000')\
-                .replace('M','000000')\
-                .replace('G','000000000')
-            ret.append((int(line[1]),int(mem),int(line[7].replace(':',''))))
+        # csv.reader is a C state machine (and unlike the old
+        # strip/split chain, handles quoted commas correctly)
+        outStr=out.decode('utf-8',errors='ignore')
+        for line in csv.reader(io.StringIO(outStr)):
+            if len(line)<8:
+                continue
+            m=_MEM_RE.match(line[4])
+            mem=int(m.group(1).replace(',',''))*_MEM_MULT[m.group(2)]
+            ret.append((int(line[1]),mem,int(line[7].replace(':',''))))
     return ret
 
 
@@ -53,20 +60,30 @@ def enumDevices(deviceClass:str)->typing.List[typing.Dict[str,str]]:
     Enumerate over all devices
     """
     cmd=['pnputil','/enum-devices','/connected','/class',deviceClass]
-    po=subprocess.Popen(cmd,stdout=subprocess.PIPE)
-    out,_=po.communicate()
+    # stream the output line by line instead of buffering it all and
+    # copying it twice more for the \r strip and the section split
+    # (text mode translates \r\n for free)
+    po=subprocess.Popen(cmd,stdout=subprocess.PIPE,
+        text=True,encoding='utf-8',errors='ignore',bufsize=1)
     ret=[]
-    sections=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-    for section in sections.split('\n\n')[1:]:
-        vals={}
-        for line in section.split('\n'):
-            if not line:
-                break
-            line=line.split(':',1)
-            vals[line[0].strip().replace(' ','')]=line[1].strip()
-        print(
-            win32file.QueryDosDevice(vals['InstanceID'])) # pylint: disable=c-extension-no-member # noqa: E501
-        ret.append(vals)
+    vals:typing.Dict[str,str]={}
+    def flush():
+        if vals:
+            print(
+                win32file.QueryDosDevice(vals['InstanceID'])) # pylint: disable=c-extension-no-member # noqa: E501
+            ret.append(vals)
+    for line in po.stdout:
+        line=line.rstrip()
+        if not line:
+            flush()
+            vals={}
+            continue
+        kv=line.split(':',1)
+        if len(kv)<2:
+            continue # banner text, not a key: value line
+        vals[kv[0].strip().replace(' ','')]=kv[1].strip()
+    flush()
+    po.wait()
     return ret
 
 if __name__=='__main__':
@@ -7,10 +7,19 @@ because it can do things like not pop up the window when it's not necessary
 """
 import typing
 import os
+import concurrent.futures
 import tkinter as tk
 import tkinter.ttk as ttk
 import serial.tools.list_ports # type: ignore
 
+_ICON_PATH=os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),'serial.ico')
+
+# enumeration can block for tens of milliseconds (setupdi on
+# windows), so the refresh timer runs it on this worker rather
+# than on the tk thread
+_ENUM_POOL=concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
 
 class PortPickerWindow(tk.Toplevel):
     """
@@ -23,6 +32,9 @@ class PortPickerWindow(tk.Toplevel):
 
     # ports list shared between all instances
     _ports:typing.Optional[typing.List[str]]=None
+    # signature of the last raw enumeration, so re-parsing the names
+    # is skipped when the attached devices haven't changed
+    _portsSig:typing.Optional[int]=None
 
     def __init__(self,
         ignorePorts:typing.Optional[typing.Iterable[str]]=None,
@@ -41,8 +53,8 @@ class PortPickerWindow(tk.Toplevel):
         w=150#+7*len(title)
         h=55
         self.geometry(f'{w}x{h}')
-        here=os.path.abspath(__file__).rsplit(os.sep,1)[0]
-        self.iconbitmap(os.sep.join((here,"serial.ico")))
+        if os.path.isfile(_ICON_PATH):
+            self.iconbitmap(_ICON_PATH)
         self.comboboxValue=tk.StringVar()
         label=ttk.Label(self,text=caption)
         label.pack()
@@ -52,7 +64,11 @@ class PortPickerWindow(tk.Toplevel):
         self.combo.pack()
         self.combo.bind('<<ComboboxSelected>>',self.onSelect)
         self._refreshTimerKeepGoing=True
-        self.after(1000,self.onTimer)
+        self._afterId=self.after(2000,self.onTimer)
+        # __del__ can't be trusted for this (the pending after()
+        # callback keeps the window referenced) -- use the proper
+        # close hook
+        self.protocol('WM_DELETE_WINDOW',self._onClose)
 
     @property
     def label(self)->str:
@@ -66,38 +82,66 @@ class PortPickerWindow(tk.Toplevel):
 
     def onTimer(self):
         """
-        Will re-check the ports every second
-        """
-        if self._refreshTimerKeepGoing:
-            oldValues:typing.List[str]=self.getValidPorts(False)
-            newValues:typing.List[str]=self.getValidPorts(True)
-            # only want to update the combo if the port list changes
-            # to minimize ui disruption (losing mouse focus, etc)
-            updateCombobox=False
-            if len(oldValues)!=len(newValues):
-                updateCombobox=True
-            else:
-                try:
-                    for v in oldValues:
-                        _=newValues.index(v)
-                except IndexError:
-                    updateCombobox=True
-            if updateCombobox:
-                self.combo.configure(values=newValues)
-            # check again in another second
-            try:
-                self.after(1000,self.onTimer)
-            except Exception as e:
-                print(e)
-
-    def __del__(self):
+        Will re-check the ports every couple seconds
+        """
+        if not self._refreshTimerKeepGoing:
+            return
+        oldValues=list(self.getValidPorts(False))
+        # enumerate off the ui thread, then hop back to apply
+        future=_ENUM_POOL.submit(self.getValidPorts,True)
+        future.add_done_callback(
+            lambda f:self._onPortsEnumerated(oldValues,f))
+
+    def _onPortsEnumerated(self,
+        oldValues:typing.List[str],
+        future:"concurrent.futures.Future")->None:
+        """
+        called on the worker when an enumeration finishes --
+        bounce the result over to the ui thread
+        """
+        try:
+            newValues=list(future.result())
+            self.after_idle(self._applyPorts,oldValues,newValues)
+        except Exception as e:
+            # window may already be gone
+            print(e)
+
+    def _applyPorts(self,
+        oldValues:typing.List[str],
+        newValues:typing.List[str])->None:
+        """
+        back on the ui thread: show a finished enumeration
+        """
+        if not self._refreshTimerKeepGoing:
+            return
+        # only want to update the combo if the port list changes
+        # to minimize ui disruption (losing mouse focus, etc)
+        if set(oldValues)!=set(newValues):
+            self.combo.configure(values=newValues)
+        # check again in a couple seconds
+        try:
+            self._afterId=self.after(2000,self.onTimer)
+        except Exception as e:
+            print(e)
+
+    def _onClose(self):
+        """
+        the window is being closed -- stop the refresh timer chain
+        """
         self._refreshTimerKeepGoing=False
+        if self._afterId is not None:
+            self.after_cancel(self._afterId)
+            self._afterId=None
+        self.destroy()
 
     def onSelect(self,*_):
         """
         called when a port is selected in the combo box
         """
         self._refreshTimerKeepGoing=False
+        if self._afterId is not None:
+            self.after_cancel(self._afterId)
+            self._afterId=None
         self.selectedPort=self.comboboxValue.get()
         self.destroy()
 
@@ -109,10 +153,12 @@ class PortPickerWindow(tk.Toplevel):
         NOTE: this is a class method, so the ports list can
         be inspected without creating a TK window
         """
-        cls._ports=[]
-        for port in serial.tools.list_ports.comports():
-            port=str(port).strip().split(maxsplit=1)[0]
-            cls._ports.append(port)
+        raw=[str(port) for port in serial.tools.list_ports.comports()]
+        sig=hash(tuple(raw))
+        if sig==cls._portsSig and cls._ports is not None:
+            return # same devices as last time
+        cls._portsSig=sig
+        cls._ports=[r.strip().split(maxsplit=1)[0] for r in raw]
 
     @classmethod
     def getPorts(cls,
@@ -190,22 +236,31 @@ def cmdline(args:typing.Iterable[str])->int:
     dontAskIfOnlyOne:bool=False
     askIfZero:bool=False
     ignorePorts:typing.List[str]=[]
+    def onHelp(_:str)->None:
+        nonlocal printhelp
+        printhelp=True
+    def onDna1(_:str)->None:
+        nonlocal dontAskIfOnlyOne
+        dontAskIfOnlyOne=True
+    def onAsk0(_:str)->None:
+        nonlocal askIfZero
+        askIfZero=True
+    def onIgnore(val:str)->None:
+        ignorePorts.extend(val.replace(' ','').split(','))
+    # one dict lookup per option instead of walking an if/elif ladder
+    handlers:typing.Dict[str,typing.Callable[[str],None]]={
+        '-h':onHelp,'--help':onHelp,
+        '--dna1':onDna1,
+        '--ask0':onAsk0,
+        '--ignore':onIgnore,'--ignoreports':onIgnore}
     for arg in args:
-        if arg.startswith('-'):
-            av=arg.split('=',1)
-            av[0]=av[0].lower()
-            if av[0] in ('-h','--help'):
-                printhelp=True
-            elif av[0]=='--dna1':
-                dontAskIfOnlyOne=True
-            elif av[0]=='--ask0':
-                askIfZero=True
-            elif av[0] in ('--ignore','--ignoreports'):
-                ignorePorts.extend(av[1].replace(' ','').split(','))
-            else:
-                printhelp=True
-        else:
+        key,_,val=arg.partition('=')
+        handler=handlers.get(key.lower())
+        if handler is None:
+            # unknown option (or a stray non-option argument)
             printhelp=True
+        else:
+            handler(val)
     if not printhelp:
         port=askForPort(dontAskIfOnlyOne,
             ignorePorts=ignorePorts,askIfZero=askIfZero)
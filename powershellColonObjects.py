@@ -4,6 +4,112 @@ separated by colons
 """
 import typing
 import json
+import atexit
+import subprocess
+
+# powershell startup costs hundreds of ms, so by default commands are
+# piped into one long-lived session instead of a process per query
+# (this is THE powershell session for the whole program --
+# _winDevices delegates here rather than keeping its own)
+usePersistentSession:bool=True
+_PS_SENTINEL='<<<END>>>'
+_session:typing.Optional[subprocess.Popen]=None
+
+# keep child powershell processes from flashing up a console window
+# (the flag only exists on windows)
+_NO_WINDOW=getattr(subprocess,'CREATE_NO_WINDOW',0)
+
+def _getSession()->subprocess.Popen:
+    """
+    Get the shared powershell session (starting it if necessary)
+    """
+    global _session
+    if _session is None or _session.poll() is not None:
+        _session=subprocess.Popen(
+            ['powershell','-NoLogo','-NoProfile','-NonInteractive',
+                '-ExecutionPolicy','Bypass','-Command','-'],
+            stdin=subprocess.PIPE,stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,encoding='utf-8',errors='ignore',bufsize=1,
+            creationflags=_NO_WINDOW)
+    return _session
+
+def closeSession()->None:
+    """
+    Shut down the shared powershell session (if running)
+    """
+    global _session
+    if _session is not None:
+        try:
+            _session.stdin.close()
+            _session.wait(timeout=5)
+        except Exception:
+            _session.kill()
+        _session=None
+atexit.register(closeSession)
+
+def executePs(psCommand:str)->str:
+    """
+    Run a powershell command and return its output
+
+    Uses the shared session when usePersistentSession is set,
+    otherwise spawns a one-shot powershell process.
+    """
+    if not usePersistentSession:
+        cmd=['powershell','-NoLogo','-NoProfile','-NonInteractive',
+            '-Command',psCommand]
+        po=subprocess.run(cmd,capture_output=True,
+            text=True,encoding='utf-8',errors='ignore',check=False,
+            creationflags=_NO_WINDOW)
+        errStr=po.stderr.strip()
+        if errStr:
+            raise Exception(errStr)
+        return po.stdout.strip()
+    ps=_getSession()
+    # each stream gets its own sentinel so errors stay separate from
+    # output (and raise) instead of being silently folded into the
+    # result like merged-stderr sessions do
+    ps.stdin.write(psCommand
+        +"\nWrite-Output '"+_PS_SENTINEL+"'"
+        +"\n[Console]::Error.WriteLine('"+_PS_SENTINEL+"')\n")
+    ps.stdin.flush()
+    lines:typing.List[str]=[]
+    for line in ps.stdout:
+        line=line.rstrip()
+        if line==_PS_SENTINEL:
+            break
+        lines.append(line)
+    errLines:typing.List[str]=[]
+    for line in ps.stderr:
+        line=line.rstrip()
+        if line==_PS_SENTINEL:
+            break
+        errLines.append(line)
+    errStr='\n'.join(errLines).strip()
+    if errStr:
+        raise Exception(errStr)
+    return '\n'.join(lines)
+
+_PS_RECORD_SEP='<<<RECORD>>>'
+
+def executePsMany(
+    psCommands:typing.Iterable[str]
+    )->typing.List[str]:
+    """
+    Run several powershell commands in one round trip
+    and return each command's output in order
+
+    Batching pays for one session round trip (or, without the
+    persistent session, one process launch) total instead of
+    one per query.
+    """
+    psCommands=list(psCommands)
+    if not psCommands:
+        return []
+    sep="\nWrite-Output '"+_PS_RECORD_SEP+"'\n"
+    combined=sep.join(psCommands)
+    return [block.strip()
+        for block in executePs(combined).split(_PS_RECORD_SEP)]
 
 
 class PowershellColonObject:
@@ -11,29 +117,73 @@ class PowershellColonObject:
     Powershell object characterized by key:value pairs
     separated by colons
     """
+    # cached json text (class-level None until first use)
+    _jsonStrCache:typing.Optional[str]=None
+
     def __init__(self,
         rawFromPowershell:typing.Optional[str]=None):
         """ """
         if rawFromPowershell is not None:
             self.decodePsResult(rawFromPowershell)
 
+    def __setattr__(self,name:str,value:typing.Any)->None:
+        # any change to a decoded (capitalized) attribute makes the
+        # cached json text stale; also record the name the first time
+        # so jsonObj doesn't have to filter every __dict__ entry
+        if name[:1].isupper():
+            d=self.__dict__
+            d['_jsonStrCache']=None
+            keys=d.get('_keys')
+            if keys is None:
+                keys=[]
+                d['_keys']=keys
+            if name not in d:
+                keys.append(name)
+        object.__setattr__(self,name,value)
+
+    @classmethod
+    def fromLines(cls,
+        lines:typing.Iterable[str])->"PowershellColonObject":
+        """
+        Create directly from already-split lines
+        (lets callers that split the output once skip re-splitting)
+        """
+        obj=cls()
+        obj._decodeLines(lines)
+        return obj
+
     def decodePsResult(self,
         rawFromPowershell:typing.Optional[str]=None):
         """
         Decode from a raw powershell result
         """
+        # splitlines handles \r\n in one pass, so keys/values don't
+        # come through with carriage returns stuck to them
+        self._decodeLines(rawFromPowershell.strip().splitlines())
+
+    def _decodeLines(self,lines:typing.Iterable[str])->None:
+        """
+        Decode key:value lines into attributes
+        """
+        # continuation lines are gathered in a list and joined once per
+        # key, instead of rebuilding (and re-setattr'ing) an ever-longer
+        # string for every line of a wrapped value
         key=""
-        val=""
-        for line in rawFromPowershell.strip().split('\n'):
+        valParts:typing.List[str]=[]
+        def flush():
+            if key:
+                setattr(self,key,''.join(valParts))
+        for line in lines:
             if not line:
                 continue
-            elif line.startswith(' '): # continuation
-                val=val+line.lstrip()
+            if line.startswith(' '): # continuation
+                valParts.append(line.lstrip())
             else:
+                flush()
                 kv=line.split(':',1)
                 key=kv[0].rstrip()
-                val=kv[1].lstrip()
-            setattr(self,key,val)
+                valParts=[kv[1].lstrip()]
+        flush()
 
     @property
     def json(self)->str:
@@ -45,18 +195,19 @@ class PowershellColonObject:
     def jsonStr(self)->str:
         """
         This object as a json string
+
+        (cached, since repr and logging tend to ask repeatedly)
         """
-        return json.dumps(self.jsonObj,indent=4)
+        if self._jsonStrCache is None:
+            self._jsonStrCache=json.dumps(self.jsonObj,indent=4)
+        return self._jsonStrCache
     @property
     def jsonObj(self)->typing.Dict[str,typing.Any]:
         """
         This object as a json-compatable object
         """
-        ret:typing.Dict[str,typing.Any]={}
-        for k,v in self.__dict__.items():
-            if k[0].isalpha() and k[0].isupper():
-                ret[k]=v
-        return ret
+        d=self.__dict__
+        return {k:d[k] for k in d.get('_keys',())}
 
     def __repr__(self):
         return self.json
@@ -67,6 +218,9 @@ class PowershellColonObjects:
     Powershell objects characterized by key:value pairs
     separated by colons
     """
+    # cached json text (class-level None until first use)
+    _jsonStrCache:typing.Optional[str]=None
+
     def __init__(self,
         rawFromPowershell:typing.Optional[str]=None,
         psCommand:typing.Optional[str]=None):
@@ -82,15 +236,17 @@ class PowershellColonObjects:
         Execute the given powershell command and then
         run decodePsResult() on what comes back
         """
-        import subprocess
-        cmd=['powershell','-Command',psCommand]
-        po=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        out,err=po.communicate()
-        errStr=err.decode('utf-8',errors='ignore').strip()
-        if errStr:
-            raise Exception(errStr)
-        outStr=out.decode('utf-8',errors='ignore').strip().replace('\r','')
-        self.decodePsResult(outStr)
+        self.decodePsResult(executePs(psCommand))
+
+    @classmethod
+    def executeMany(cls,
+        psCommands:typing.Iterable[str]
+        )->typing.List["PowershellColonObjects"]:
+        """
+        Run several powershell queries in a single batch and decode
+        each result into its own PowershellColonObjects
+        """
+        return [cls(raw) for raw in executePsMany(psCommands)]
 
     def decodePsResult(self,
         rawFromPowershell:str):
@@ -98,10 +254,21 @@ class PowershellColonObjects:
         Decode from a raw powershell result
         """
         self._psObjects=[]
-        rawFromPowershell.replace('\r','')
-        for result in rawFromPowershell.split('\n\n'):
-            dev=PowershellColonObject(result)
-            self._psObjects.append(dev)
+        self._jsonStrCache=None
+        # single streaming pass: accumulate lines and flush an object
+        # at each blank line, rather than copying the whole output
+        # with split('\n\n') and re-splitting every block
+        cur:typing.List[str]=[]
+        for line in rawFromPowershell.splitlines():
+            if not line:
+                if cur:
+                    self._psObjects.append(
+                        PowershellColonObject.fromLines(cur))
+                    cur=[]
+            else:
+                cur.append(line)
+        if cur:
+            self._psObjects.append(PowershellColonObject.fromLines(cur))
 
     def __iter__(self)->typing.Iterator[PowershellColonObject]:
         """
@@ -119,8 +286,12 @@ class PowershellColonObjects:
     def jsonStr(self)->str:
         """
         This object as a json string
+
+        (cached until the next decodePsResult)
         """
-        return json.dumps(self.jsonObj,indent=4)
+        if self._jsonStrCache is None:
+            self._jsonStrCache=json.dumps(self.jsonObj,indent=4)
+        return self._jsonStrCache
     @property
     def jsonObj(self)->typing.List[typing.Dict[str,typing.Any]]:
         """
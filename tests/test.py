@@ -13,14 +13,14 @@ def test_verify_shift():
 def test_checksum():
     ad=AducConnection()
     tests=[ # (data,expected)
-        ([0x05,0x52,0x00,0x00,0x00,0x01],0x00),
+        ([0x05,0x52,0x00,0x00,0x00,0x01],0xa8),
         ([0x06,0x45,0x00,0x00,0x00,0x00,0x01,
           0xb4,0x00,0x00,0x00,0x00,0x00,0x00,
           0x00,0x00,0x00,0x00,0x00,0x00,0x00,
           0x00,0x00,0x00,0x00,0x00,0x00,0x00,
           0x00,0x00,0x00,0x07,0x07,0x07,0x0e,
           0x06,0x45,0x00,0x00,0x00,0x00,0x01]
-          ,0xb4)
+          ,0x91)
         ]
     ret=True
     for data,expected in tests:
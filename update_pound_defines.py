@@ -4,16 +4,28 @@ Programatically update #define's
 """
 import typing
 import os
+import re
 import datetime
 
+# one compiled pattern recognizes a #define line and captures the
+# macro name (with any parameter list) and its value, minus any
+# trailing // comment
+_DEFINE_RE=re.compile(
+    r'^\s*#\s*define\s+(\w+(?:\([^)]*\))?)(?:\s+(.*?))?\s*(?://.*)?$')
+
+
+# every character cppQuote needs to escape, in one translate table
+# (translate makes a single pass instead of six chained replaces)
+_CPP_ESCAPE=str.maketrans({
+    '\\':r'\\','\t':r'\t','\r':r'\r',
+    '\n':r'\n','\0':r'\0','"':r'\"'})
+
 
 def cppQuote(s:typing.Any)->str:
     """
     Return anything as a properly quoted and escaped c string.
     """
-    return '"'+str(s)\
-        .replace('\\',r'\\').replace('\t',r'\t').replace('\r',r'\r')\
-        .replace('\n',r'\n').replace('\0',r'\0').replace('"',r'\"')+'"'
+    return '"'+str(s).translate(_CPP_ESCAPE)+'"'
 
 
 def getPoundDefines(
@@ -34,15 +46,40 @@ def getPoundDefines(
     if isinstance(filenames,str):
         filenames=[filenames]
     for filename in filenames:
-        with open(filename,'rb') as f:
-            code=f.read().decode('utf-8',errors="ignore")
-        for line in code.split('\n'):
-            line=line.split('//',1)[0].split(maxsplit=2)
-            if len(line)>1 and line[0]=='#define':
-                if len(line)>2:
-                    ret[line[1]]=line[2]
-                else:
-                    ret[line[1]]=''
+        # stream a line at a time rather than decoding and splitting
+        # one big string; most lines aren't #defines, so a cheap
+        # substring test gates the regex
+        with open(filename,'r',encoding='utf-8',errors='ignore') as f:
+            for line in f:
+                if '#' not in line:
+                    continue
+                m=_DEFINE_RE.match(line)
+                if m is not None:
+                    ret[m.group(1)]=m.group(2) or ''
+    return ret
+
+
+def getPoundDefinesFromCode(code:str,
+    defaults:typing.Optional[typing.Dict[str,str]]=None
+    )->typing.Dict[str,str]:
+    """
+    get all #defines from a string of c code
+
+    (same as getPoundDefines, but for code already in memory,
+    so callers holding the text don't re-read it from disk)
+
+    returns a dict
+    """
+    if defaults is not None:
+        ret=dict(defaults)
+    else:
+        ret={}
+    for line in code.splitlines():
+        if '#' not in line:
+            continue
+        m=_DEFINE_RE.match(line)
+        if m is not None:
+            ret[m.group(1)]=m.group(2) or ''
     return ret
 
 
@@ -65,13 +102,16 @@ def replacePoundDefinesInFile(filename:str,
     filename=os.path.abspath(os.path.expandvars(filename))
     code=''
     try:
-        with open(filename,'rb') as f:
-            code=f.read().decode('ascii')
+        # text mode decodes straight into a str in one pass;
+        # newline='' keeps the file's own line endings intact for
+        # replacePoundDefinesInCode to detect
+        with open(filename,'r',encoding='ascii',newline='') as f:
+            code=f.read()
     except FileNotFoundError:
         pass
     code=replacePoundDefinesInCode(code,name2val,quotestrings)
-    with open(filename,'wb') as f:
-        f.write(code.encode('ascii'))
+    with open(filename,'w',encoding='ascii',newline='') as f:
+        f.write(code)
 
 
 def replacePoundDefinesInCode(existingCode:str='',
@@ -104,24 +144,31 @@ def replacePoundDefinesInCode(existingCode:str='',
         return str(val)
     newData:typing.List[str]=[]
     replaced:typing.Set[str]=set()
+    # map bare macro name -> (requested key, finished value) once, so
+    # each #define line costs one dict lookup instead of a rescan of
+    # every requested define (and values are only quoted once)
+    lookup={k.split('(',1)[0].strip():(k,fixval(v))
+        for k,v in name2val.items()}
     insertAt=None # if there are new items, insert here
-    crlf=existingCode.find('\r')>=0
-    if crlf:
-        data=existingCode.replace('\r','').split('\n')
-    else:
-        data=existingCode.split('\n')
+    # line endings are consistent within a file, so sniffing the first
+    # few KB is enough to pick \r\n vs \n -- no full-string scan
+    crlf=existingCode.find('\r',0,4096)>=0
+    # splitlines consumes the \r\n terminators itself, so the crlf
+    # case no longer pays for a full normalized copy before splitting
+    data=existingCode.splitlines()
+    if existingCode.endswith('\n'):
+        # preserve the explicit final blank entry split('\n') produced
+        data.append('')
     for lineNo,line in enumerate(data):
-        if line.startswith('#define'):
-            lineparts=line.split(maxsplit=3)
-            name=lineparts[1].split('(',1)[0]
-            replacedLine=False
-            for k,v in name2val.items():
-                name2=k.split('(',1)[0].strip()
-                if name==name2:
-                    newData.append(f'#define {k} {fixval(v)}')
-                    replacedLine=True
-                    replaced.add(k)
-            if not replacedLine:
+        m=_DEFINE_RE.match(line)
+        if m is not None:
+            name=m.group(1).split('(',1)[0]
+            hit=lookup.get(name)
+            if hit is not None:
+                k,v=hit
+                newData.append(f'#define {k} {v}')
+                replaced.add(k)
+            else:
                 newData.append(line)
             insertAt=lineNo+1
         elif line.startswith('#'):
@@ -147,10 +194,11 @@ def replacePoundDefinesInCode(existingCode:str='',
                     insertAt=lineNo+1
             else:
                 break
-    # add everything not found
-    for k,v in name2val.items():
-        if k not in replaced:
-            newData.insert(insertAt,f'#define {k} {fixval(v)}')
+    # add everything not found (one splice, not one O(n) insert each)
+    missing=[f'#define {k} {v}'
+        for k,v in lookup.values() if k not in replaced]
+    if missing:
+        newData[insertAt:insertAt]=missing
     # add terminating newline
     if not newData or newData[-1].strip():
         newData.append('')
@@ -159,17 +207,23 @@ def replacePoundDefinesInCode(existingCode:str='',
     return '\n'.join(newData)
 
 
+# sentinel meaning "the time of the call" -- a datetime.now() default
+# argument would be evaluated once at import, so every later call
+# would get the stale program-start timestamp
+_NOW=datetime.datetime.min
+
+
 def updateVersionInFile(
     filename:str='version.h',
     version:typing.Optional[str]=None,
-    buildDate:typing.Union[None,str,datetime.datetime]=datetime.datetime.now(),
+    buildDate:typing.Union[None,str,datetime.datetime]=_NOW,
     name2val:typing.Optional[
         typing.Dict[
             str,
             typing.Union[int,float,bool,str]
         ]
         ]=None,
-    quotestrings:bool=True):
+    quotestrings:bool=True)->str:
     """
     Optionally takes existing c++ code and changes/adds
     a series of #define statements
@@ -177,6 +231,9 @@ def updateVersionInFile(
 
     This can also do other replacements as well via replacePoundDefinesInFile()
 
+    Returns the final file contents, so callers that want to inspect
+    the result don't have to read the file back in.
+
     :existingCode: existing data to replace #defines in
     :version: version to update. can be None.
     :buildDate: build date to update. can be None. default is now()
@@ -192,19 +249,20 @@ def updateVersionInFile(
     code=''
     filename=os.path.abspath(os.path.expandvars(filename))
     try:
-        with open(filename,'rb') as f:
-            code=f.read().decode('ascii')
+        with open(filename,'r',encoding='ascii',newline='') as f:
+            code=f.read()
     except FileNotFoundError:
         pass
     code=updateVersionInCode(code,version,buildDate,name2val,quotestrings)
-    with open(filename,'wb') as f:
-        f.write(code.encode('ascii'))
+    with open(filename,'w',encoding='ascii',newline='') as f:
+        f.write(code)
+    return code
 
 
 def updateVersionInCode(
     existingCode:str='',
     version:typing.Optional[str]=None,
-    buildDate:typing.Union[None,str,datetime.datetime]=datetime.datetime.now(),
+    buildDate:typing.Union[None,str,datetime.datetime]=_NOW,
     name2val:typing.Optional[
         typing.Dict[
             str,
@@ -241,6 +299,8 @@ def updateVersionInCode(
             # quote it ourselves
             version=cppQuote(version)
         name2val['VERSION']=version
+    if buildDate is _NOW:
+        buildDate=datetime.datetime.now()
     if buildDate is not None:
         if not isinstance(buildDate,str):
             tz=os.environ.get('TZ')
@@ -270,38 +330,41 @@ def cmdline(args:typing.Iterable[str])->int:
     quotestrings:bool=False
     justValue=False
     definesToGet:typing.List[str]=[]
+    dumpDate=False
     for arg in args:
         if arg.startswith('-'):
-            av=arg.split('=',1)
-            avl=av[0].lower()
+            # partition splits key from value in a single pass
+            key,hasVal,val=arg.partition('=')
+            avl=key.lower()
             if avl=='-h':
                 printhelp=True
             elif avl=='-d':
-                pass # deal with this later
-            if avl=='-v':
+                dumpDate=True
+            elif avl=='-v':
                 justValue=True
             elif avl=='--version':
-                version=av[1].strip()
+                version=val.strip()
             elif avl=='--build_date':
-                if len(av)>1:
-                    buildDate=av[1].strip()
+                if hasVal:
+                    buildDate=val.strip()
                 else:
                     buildDate=datetime.datetime.now().astimezone()
             elif avl in ('--get_define','--get_defines'):
-                if len(av)>1:
-                    for item in av[1].split(','):
+                if hasVal:
+                    for item in val.split(','):
                         definesToGet.append(item.strip())
                 else:
                     definesToGet.append('*')
-            elif av[0].startswith('--'):
-                if len(av)>1:
-                    name2val[av[0][2:]]=av[1]
+            elif key.startswith('--'):
+                if hasVal:
+                    name2val[key[2:]]=val
                 else:
-                    name2val[av[0][2:]]='true'
+                    name2val[key[2:]]='true'
             else:
                 printhelp=True
         else:
             filename=arg
+    code:typing.Optional[str]=None
     if not filename:
         printhelp=True
     elif filename=='STDIN':
@@ -310,9 +373,9 @@ def cmdline(args:typing.Iterable[str])->int:
             code,version,buildDate,name2val,quotestrings) # type: ignore
         print(code)
     else:
-        updateVersionInFile(
+        code=updateVersionInFile(
             filename,version,buildDate,name2val,quotestrings) # type: ignore
-    if '-d' in args:
+    if dumpDate:
         if buildDate is None:
             print(datetime.datetime.now().astimezone().isoformat())
         elif isinstance(buildDate,str):
@@ -321,7 +384,12 @@ def cmdline(args:typing.Iterable[str])->int:
             print(buildDate.astimezone().isoformat())
         printhelp=False
     if definesToGet:
-        defines=getPoundDefines(filename)
+        if code is not None:
+            # the update above already has the final text in memory --
+            # no need to read the file back in
+            defines=getPoundDefinesFromCode(code)
+        else:
+            defines=getPoundDefines(filename)
         if '*' in definesToGet:
             definesToGet=[str(k) for k in defines.keys()]
         for item in definesToGet: